@@ -1,29 +1,95 @@
 import streamlit as st
-import pubchempy as pcp
 import pandas as pd
 import os
+from collections import OrderedDict
 import numpy as np
-import matplotlib.pyplot as plt
 from io import BytesIO
-from fpdf import FPDF
 
 st.set_page_config(page_title="Consulta e Simulação - PubChem + Eletroforese", layout="centered")
 st.title("🔬 Consulta de Moléculas + Simulação de Eletroforese")
 
 # Criar banco local se não existir
 ARQUIVO_CSV = "banco_moleculas.csv"
+COLUNAS_BANCO = ["Nome", "Fórmula", "Peso Molecular", "SMILES", "CID"]
 if not os.path.exists(ARQUIVO_CSV):
-    df_vazio = pd.DataFrame(columns=["Nome", "Fórmula", "Peso Molecular", "SMILES", "CID"])
+    df_vazio = pd.DataFrame(columns=COLUNAS_BANCO)
     df_vazio.to_csv(ARQUIVO_CSV, index=False)
 
-# Função para buscar no PubChem
+# Leitura do banco cacheada; a data de modificação do arquivo entra na chave do cache
+@st.cache_data(show_spinner=False)
+def _ler_banco(mtime):
+    return pd.read_csv(ARQUIVO_CSV)
+
+# Cópia para exibição com tipos menores (menos dados serializados para o navegador);
+# o arquivo continua sendo lido e gravado com os tipos originais
+@st.cache_data(show_spinner=False)
+def _banco_exibicao(mtime):
+    df = _ler_banco(mtime)
+    df["CID"] = pd.to_numeric(df["CID"], errors="coerce").astype("Int32")
+    df["Peso Molecular"] = pd.to_numeric(df["Peso Molecular"], errors="coerce").astype("float32")
+    df["Fórmula"] = df["Fórmula"].astype("category")
+    return df
+
+def carregar_banco():
+    return _banco_exibicao(os.path.getmtime(ARQUIVO_CSV))
+
+# Propriedades usadas na simulação como vetores contíguos + índice nome -> posição.
+# Tudo que depende só da massa é calculado aqui, uma vez por versão do banco
+@st.cache_data(show_spinner=False)
+def _vetores_banco(mtime):
+    banco = _ler_banco(mtime).drop_duplicates("Nome")
+    indice = {nome: i for i, nome in enumerate(banco["Nome"])}
+    massas = banco["Peso Molecular"].to_numpy(dtype=np.float64)
+    razoes = carga_por_massa(massas)
+    intensidades = (np.exp(-massas / 300) * 100).astype(np.float32)
+    larguras = 0.5 + massas / 500
+    # Coeficiente do expoente da gaussiana, -1 / (2 * largura²), já pronto para multiplicar
+    coeficientes = (-0.5 / larguras**2).astype(np.float32)
+    return indice, razoes, intensidades, coeficientes
+
+# CIDs já salvos (inteiros), mantidos na sessão como set; recarregados só quando o CSV muda
+def cids_banco():
+    mtime = os.path.getmtime(ARQUIVO_CSV)
+    if st.session_state.get("banco_mtime") != mtime:
+        cids = pd.to_numeric(_ler_banco(mtime)["CID"], errors="coerce").dropna().astype("int64")
+        st.session_state.banco_cids = set(cids)
+        st.session_state.banco_mtime = mtime
+    return st.session_state.banco_cids
+
+# Acrescenta uma molécula ao fim do CSV, sem reler nem regravar o arquivo inteiro
+def adicionar_ao_banco(registro):
+    pd.DataFrame([registro], columns=COLUNAS_BANCO).to_csv(ARQUIVO_CSV, mode="a", header=False, index=False)
+    _ler_banco.clear()
+    _banco_exibicao.clear()
+    _vetores_banco.clear()
+
+# Fator de correção do pH (escalar, calculado uma vez por simulação)
+def fator_ph(pH):
+    return (1 + (pH - 7) * 0.1) * 1e5
+
+# Razão carga relativa / massa (não depende das condições da simulação)
+def carga_por_massa(massas):
+    cargas_simuladas = np.where(massas > 120, -1.0, 1.0)
+    return cargas_simuladas / massas
+
+# Tempo de migração t = L / (μ·V), com mobilidade μ = razão carga/massa · fator_ph(pH).
+# A parte escalar é resolvida em Python puro e aplicada ao vetor numa única divisão
+def calcular_tempos_migracao(razoes, voltagem, comprimento_capilar, pH):
+    escala = comprimento_capilar / (voltagem * fator_ph(pH))
+    return escala / razoes
+
+# Função para buscar no PubChem (cacheada para não repetir a consulta a cada rerun).
+# O cache é persistido em disco, então sobrevive a reinícios do servidor
+@st.cache_data(persist="disk", show_spinner=False)
 def buscar_molecula(nome):
+    import pubchempy as pcp
+
     try:
         mol = pcp.get_compounds(nome, 'name')[0]
         dados = {
             "Nome": mol.iupac_name,
             "Fórmula": mol.molecular_formula,
-            "Peso Molecular": mol.molecular_weight,
+            "Peso Molecular": float(mol.molecular_weight),
             "SMILES": mol.canonical_smiles,
             "CID": mol.cid
         }
@@ -31,24 +97,63 @@ def buscar_molecula(nome):
     except IndexError:
         return None
 
-# Entrada do usuário
-nome_molecula = st.text_input("Digite o nome da molécula:")
+# Imagem da estrutura baixada uma única vez por CID e compartilhada entre sessões
+# (só downloads bem-sucedidos ficam no cache; exceções não são cacheadas)
+@st.cache_resource(show_spinner=False)
+def baixar_estrutura(cid):
+    import requests
+
+    resposta = requests.get(url_estrutura(cid), timeout=10)
+    resposta.raise_for_status()
+    return resposta.content
+
+def url_estrutura(cid):
+    return f"https://pubchem.ncbi.nlm.nih.gov/rest/pug/compound/cid/{cid}/PNG"
 
-if nome_molecula:
-    dados = buscar_molecula(nome_molecula)
+# Bytes da estrutura; se o download falhar (timeout, limite do PubChem), devolve a URL
+# para o navegador carregar a imagem diretamente, sem interromper o script
+def imagem_estrutura(cid):
+    import requests
+
+    try:
+        return baixar_estrutura(cid)
+    except requests.RequestException:
+        return url_estrutura(cid)
+
+# Entrada do usuário (formulário: o PubChem só é consultado ao enviar a busca)
+with st.form("busca"):
+    nome_molecula = st.text_input("Digite o nome da molécula:")
+    buscar = st.form_submit_button("Buscar")
+
+if buscar:
+    # A consulta só é refeita quando o texto muda; os demais reruns reaproveitam o resultado
+    consulta = nome_molecula.strip().lower()
+    if st.session_state.get("ultima_consulta") != consulta:
+        molecula = buscar_molecula(consulta) if consulta else None
+        # Guarda o resultado antes da imagem: a estrutura é opcional e não invalida a busca
+        st.session_state.ultima_molecula = molecula
+        st.session_state.ultima_estrutura = None
+        st.session_state.ultima_consulta = consulta
+        if molecula:
+            st.session_state.ultima_estrutura = imagem_estrutura(molecula['CID'])
+
+if st.session_state.get("ultima_consulta"):
+    dados = st.session_state.ultima_molecula
     if dados:
         st.success("Molécula encontrada!")
         st.dataframe(pd.DataFrame([dados]))
 
         # Mostrar imagem da estrutura
-        st.image(f"https://pubchem.ncbi.nlm.nih.gov/rest/pug/compound/cid/{dados['CID']}/PNG", caption="Estrutura da Molécula")
+        if st.session_state.ultima_estrutura is not None:
+            st.image(st.session_state.ultima_estrutura, caption="Estrutura da Molécula")
 
         # Botão para salvar no banco local
         if st.button("Salvar no banco local"):
-            banco_df = pd.read_csv(ARQUIVO_CSV)
-            if dados['CID'] not in banco_df['CID'].values:
-                banco_df = pd.concat([banco_df, pd.DataFrame([dados])], ignore_index=True)
-                banco_df.to_csv(ARQUIVO_CSV, index=False)
+            cids = cids_banco()
+            if int(dados['CID']) not in cids:
+                adicionar_ao_banco(dados)
+                cids.add(int(dados['CID']))
+                st.session_state.banco_mtime = os.path.getmtime(ARQUIVO_CSV)
                 st.success("Molécula salva no banco!")
             else:
                 st.warning("Essa molécula já está no banco.")
@@ -57,9 +162,89 @@ if nome_molecula:
 
 # Mostrar banco de moléculas local
 st.subheader("📁 Banco de Moléculas Local")
-banco_df = pd.read_csv(ARQUIVO_CSV)
+banco_df = carregar_banco()
 st.dataframe(banco_df, use_container_width=True)
 
+# Classe do relatório PDF criada uma vez por processo (o script é reexecutado a cada rerun)
+@st.cache_resource
+def classe_pdf():
+    from fpdf import FPDF
+
+    class PDF(FPDF):
+        def header(self):
+            self.set_font("Arial", "B", 12)
+            self.cell(0, 10, "Relatório de Simulação de Eletroforese", ln=True, align="C")
+    return PDF
+
+# Relatório PDF montado só quando pedido e cacheado pelos dados da simulação
+@st.cache_data(show_spinner=False, max_entries=64)
+def gerar_relatorio_pdf(nomes_ordenados, voltagem, comprimento_capilar, pH, imagem_cromatograma):
+    pdf = classe_pdf()()
+    pdf.add_page()
+    pdf.set_font("Arial", size=10)
+
+    parametros = "\n".join([
+        f"Moléculas Simuladas: {', '.join(nomes_ordenados)}",
+        f"Voltagem: {voltagem} kV | Comprimento do capilar: {comprimento_capilar} cm | pH: {pH}",
+    ])
+    pdf.multi_cell(0, 10, parametros)
+
+    pdf.image(BytesIO(imagem_cromatograma), x=10, y=pdf.get_y(), w=180)
+    return bytes(pdf.output())
+
+# Cromatograma renderizado em PNG e cacheado pelas curvas de entrada.
+# Usa Figure direto (sem pyplot): a figura não entra no registro global e é liberada ao sair
+@st.cache_data(show_spinner=False, max_entries=256)
+def renderizar_cromatograma(t, y):
+    from matplotlib.figure import Figure
+
+    fig = Figure()
+    ax = fig.subplots()
+    ax.plot(t, y, color='purple')
+    ax.set_xlabel("Tempo (s)")
+    ax.set_ylabel("Intensidade (u.a.)")
+    ax.set_title("Cromatograma Simulado de Eletroforese")
+    buffer = BytesIO()
+    fig.savefig(buffer, format="png")
+    return buffer.getvalue()
+
+# Resolução do eixo de tempo: os picos têm largura >= 0.5 s numa janela de poucos segundos,
+# então 400 pontos já dão dezenas de amostras por pico
+PONTOS_CROMATOGRAMA = 400
+
+# Quantas simulações cada sessão guarda para reaproveitar ao voltar a um ajuste anterior
+MAX_SIMULACOES_SESSAO = 64
+
+# Simulação vetorizada: devolve os nomes na ordem de migração e o cromatograma (t, y).
+# Cacheada entre sessões; mtime é a versão do banco de onde vêm as propriedades
+@st.cache_data(show_spinner=False, max_entries=256)
+def simular_cromatograma(selecionadas, voltagem, comprimento_capilar, pH, ruido, mtime):
+    # Propriedades de todas as moléculas selecionadas como vetores NumPy
+    indice_mol, razoes_banco, intensidades_banco, coeficientes_banco = _vetores_banco(mtime)
+    idx = np.fromiter((indice_mol[nome] for nome in selecionadas), dtype=int, count=len(selecionadas))
+    # Sinais usados só para o gráfico: float32 basta e reduz os dados pela metade
+    tempos = calcular_tempos_migracao(razoes_banco[idx], voltagem, comprimento_capilar, pH).astype(np.float32)
+    intensidades = intensidades_banco[idx]
+    coeficientes = coeficientes_banco[idx]
+
+    nomes_ordenados = [selecionadas[i] for i in np.argsort(tempos)]
+    t = np.linspace(0, tempos.max() + 5, PONTOS_CROMATOGRAMA, dtype=np.float32)
+
+    # Picos gaussianos calculados de uma vez (moléculas x pontos) e somados,
+    # reaproveitando o mesmo buffer em todas as etapas
+    picos = np.subtract(t[None, :], tempos[:, None])
+    np.square(picos, out=picos)
+    picos *= coeficientes[:, None]
+    np.exp(picos, out=picos)
+    picos *= intensidades[:, None]
+    y = picos.sum(axis=0)
+
+    if ruido:
+        # Semente fixa: o mesmo conjunto de entradas gera o mesmo gráfico (e acerta o cache)
+        y += np.random.default_rng(0).standard_normal(len(y), dtype=np.float32) * 0.5
+
+    return nomes_ordenados, t, y
+
 # ---------------------- Simulação de Eletroforese ----------------------
 st.subheader("⚡ Simulação de Eletroforese Capilar")
 st.markdown("Simule tempos de migração com base em massa molar e carga relativa.")
@@ -72,67 +257,23 @@ if not banco_df.empty:
     ruido = st.checkbox("Adicionar ruído ao cromatograma", value=True)
 
     if selecionadas:
-        tempo_base = comprimento_capilar / (voltagem * 1e3)
-        tempos = []
-        intensidades = []
-        massas = []
-
-        for nome in selecionadas:
-            linha = banco_df[banco_df["Nome"] == nome].iloc[0]
-            massa = linha["Peso Molecular"]
-            carga_simulada = -1 if massa > 120 else 1
-            mobilidade = (carga_simulada / massa) * (1 + (pH - 7) * 0.1) * 1e5
-            tempo_migracao = comprimento_capilar / (mobilidade * voltagem)
-            intensidade = np.exp(-massa / 300) * 100
-            tempos.append((nome, tempo_migracao))
-            intensidades.append(intensidade)
-            massas.append(massa)
-
-        tempos_ordenados = sorted(zip(tempos, intensidades, massas), key=lambda x: x[0][1])
-        t = np.linspace(0, max([x[0][1] for x in tempos_ordenados]) + 5, 1000)
-        y = np.zeros_like(t)
-
-        for (nome, tempo), intensidade, massa in tempos_ordenados:
-            largura = 0.5 + massa / 500
-            pico = intensidade * np.exp(-((t - tempo)**2) / (2 * largura**2))
-            y += pico
-
-        if ruido:
-            y += np.random.normal(0, 0.5, size=len(y))
-
-        fig, ax = plt.subplots()
-        ax.plot(t, y, color='purple')
-        ax.set_xlabel("Tempo (s)")
-        ax.set_ylabel("Intensidade (u.a.)")
-        ax.set_title("Cromatograma Simulado de Eletroforese")
-        st.pyplot(fig)
-
-        # Exportar PDF
-        buffer = BytesIO()
-        fig.savefig(buffer, format="png")
-        buffer.seek(0)
-
-        class PDF(FPDF):
-            def header(self):
-                self.set_font("Arial", "B", 12)
-                self.cell(0, 10, "Relatório de Simulação de Eletroforese", ln=True, align="C")
+        # Resultados das últimas simulações da sessão (LRU), indexados pelas entradas e pela versão do banco
+        chave_simulacao = (tuple(selecionadas), voltagem, comprimento_capilar, pH, ruido, os.path.getmtime(ARQUIVO_CSV))
+        simulacoes = st.session_state.setdefault("simulacoes", OrderedDict())
+        if chave_simulacao in simulacoes:
+            simulacoes.move_to_end(chave_simulacao)
+        else:
+            simulacoes[chave_simulacao] = simular_cromatograma(*chave_simulacao)
+            if len(simulacoes) > MAX_SIMULACOES_SESSAO:
+                simulacoes.popitem(last=False)
+        nomes_ordenados, t, y = simulacoes[chave_simulacao]
 
-        if st.button("📄 Exportar PDF da Simulação"):
-            pdf = PDF()
-            pdf.add_page()
-            pdf.set_font("Arial", size=10)
-
-            pdf.cell(0, 10, f"Moléculas Simuladas: {', '.join([x[0][0] for x in tempos_ordenados])}", ln=True)
-            pdf.cell(0, 10, f"Voltagem: {voltagem} kV | Comprimento do capilar: {comprimento_capilar} cm | pH: {pH}", ln=True)
+        imagem_cromatograma = renderizar_cromatograma(t, y)
+        st.image(imagem_cromatograma)
 
-            img_path = "cromatograma_temp.png"
-            with open(img_path, "wb") as f:
-                f.write(buffer.read())
-            pdf.image(img_path, x=10, y=40, w=180)
-            pdf.output("simulacao_eletroforese.pdf")
-
-            with open("simulacao_eletroforese.pdf", "rb") as f:
-                st.download_button("📥 Baixar PDF", f, file_name="simulacao_eletroforese.pdf")
+        if st.button("📄 Exportar PDF da Simulação"):
+            pdf_bytes = gerar_relatorio_pdf(tuple(nomes_ordenados), voltagem, comprimento_capilar, pH, imagem_cromatograma)
+            st.download_button("📥 Baixar PDF", data=pdf_bytes, file_name="simulacao_eletroforese.pdf")
     else:
         st.info("Selecione moléculas para simular.")
 else: